@@ -17,15 +17,34 @@
 # - websockets: For WebSocket server implementation.
 # - pyaudio: For audio playback. (May require extra steps to install on Android/Termux,
 #            e.g., installing portaudio via 'pkg install portaudio')
-# - numpy: For generating the sine wave audio signal.
+# - numpy: (optional) Faster generation of the sine wave audio signal at
+#          startup; a stdlib fallback is used when it is not installed.
 
+import array
 import asyncio
+import atexit
+import collections
+import logging
+import socket
 import websockets
 import pyaudio
-import numpy as np
 import math
 import time
 
+try:
+    # Optional: only used to synthesize the response tone at startup. Minimal
+    # Termux installs often lack NumPy, so a stdlib fallback exists below.
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    # Optional: Numba compiles the sine kernel down to a tight native loop.
+    # It is often not installable on Android/Termux, so it must stay optional.
+    from numba import njit
+except ImportError:
+    njit = None
+
 # --- Global Audio Constants ---
 # These constants define the audio stream parameters. They should ideally match
 # the parameters used by the PC client sending the audio.
@@ -34,11 +53,110 @@ FORMAT = pyaudio.paInt16  # Audio format for playback and generated sine wave. p
 CHANNELS = 1             # Mono audio. Set to 2 for stereo if needed.
 RATE = 44100             # Sample rate in Hz. Common for CD-quality audio.
 CHUNK = 1024             # Number of frames per buffer for audio playback. Affects latency.
+# Cap on chunks queued for playback. Clients can send faster than the speaker
+# drains; without a bound the deque grows without limit and playback latency
+# with it. On overflow the deque drops its oldest entries, so playback skips
+# ahead to recent audio instead of falling ever further behind.
+PENDING_CHUNKS_MAX = 50
 
 # Constants for the simulated Gemini Live response (sine wave)
 SINE_FREQUENCY = 440.0   # Frequency of the sine wave in Hz (A4 musical note).
 SINE_DURATION = 0.5      # Duration of the generated sine wave in seconds.
 
+NUM_SINE_SAMPLES = int(SINE_DURATION * RATE)
+
+def _fill_sine_pcm(out, freq, rate, n):
+    # Scalar loop written for Numba. Instead of a libm sin() per sample, a
+    # fixed-frequency sine obeys the two-tap oscillator recurrence
+    #   y[i] = 2*cos(w)*y[i-1] - y[i-2]
+    # which costs one multiply and one subtract per sample; only the two seed
+    # values need real sin() calls. (Rounding drift over 22k samples is far
+    # below one int16 step.)
+    w = 2.0 * math.pi * freq / rate
+    c = 2.0 * math.cos(w)
+    y1 = math.sin(-w)       # y[-1]
+    y2 = math.sin(-2.0 * w) # y[-2]
+    amp = 0.5 * 32767
+    for i in range(n):
+        y0 = c * y1 - y2
+        out[i] = int(amp * y0)
+        y2 = y1
+        y1 = y0
+
+if njit is not None and np is not None:
+    _fill_sine_pcm = njit(cache=True)(_fill_sine_pcm)
+elif np is not None:
+    def _fill_sine_pcm(out, freq, rate, n):
+        # NumPy fallback: the recurrence is inherently sequential and would be
+        # slow as a Python-level loop, so keep the vectorized sin() here and
+        # reuse one float64 scratch buffer with in-place ops instead of the
+        # four temporaries of the naive linspace/sin pipeline.
+        phase = np.arange(n, dtype=np.float64)
+        phase *= 2.0 * np.pi * freq / rate
+        np.sin(phase, out=phase)
+        phase *= 0.5 * 32767
+        out[:] = phase.astype(np.int16)
+
+# The simulated response never changes (frequency, duration and rate are all
+# constants), so the buffer is filled exactly once at module load. SINE_PCM is
+# a zero-copy bytes-like view over that buffer — websockets accepts any
+# buffer-protocol object, so no intermediate bytes object is ever created.
+# The per-message hot path in the handler is then a single websocket.send().
+if np is not None:
+    _SINE_BUF = np.empty(NUM_SINE_SAMPLES, dtype=np.int16)
+    _fill_sine_pcm(_SINE_BUF, SINE_FREQUENCY, RATE, NUM_SINE_SAMPLES)
+    SINE_PCM = memoryview(_SINE_BUF).cast("B")
+else:
+    # Stdlib-only generation (no NumPy, no float64 temporaries): synthesize the
+    # shortest block holding a whole number of cycles into array.array('h'),
+    # then replicate its bytes out to the full duration.
+    if SINE_FREQUENCY == int(SINE_FREQUENCY):
+        _block_samples = RATE // math.gcd(int(SINE_FREQUENCY), RATE)
+    else:
+        _block_samples = NUM_SINE_SAMPLES # Non-integral pitch: no exact short period.
+    _block = array.array('h', (int(0.5 * 32767 * math.sin(2.0 * math.pi * SINE_FREQUENCY * i / RATE))
+                               for i in range(_block_samples)))
+    _reps = -(-NUM_SINE_SAMPLES // _block_samples) # Ceiling division.
+    SINE_PCM = memoryview((_block.tobytes() * _reps)[:NUM_SINE_SAMPLES * 2])
+
+# Per-message diagnostics go through a DEBUG-level logger so they cost nothing
+# at the default INFO level. print() grabs the stdout lock and flushes per
+# call — on Termux, stdout is usually a PTY, making each one a syscall.
+log = logging.getLogger(__name__)
+
+# Process-wide PyAudio instance, shared by all connection handlers. PyAudio
+# init probes every PortAudio host API (hundreds of ms on Android), so paying
+# it per connection made connection setup needlessly slow. Handlers open and
+# close only their own stream; the instance is terminated once at exit.
+_PA = pyaudio.PyAudio()
+atexit.register(_PA.terminate)
+
+def make_playback_callback(pending_chunks):
+    """Builds a PortAudio output callback fed from a deque of audio chunks.
+
+    The WebSocket handler only appends received chunks to 'pending_chunks';
+    the PortAudio thread pulls from it here, so playback never blocks the
+    asyncio event loop. On underflow the callback emits silence and keeps
+    the stream alive. deque.append/popleft are atomic under the GIL, so no
+    extra locking is needed for this single-producer/single-consumer pair.
+    """
+    leftover = bytearray() # Partial chunk carried over between callbacks.
+
+    def _playback_callback(_in_data, frame_count, _time_info, _status):
+        bytes_needed = frame_count * CHANNELS * 2 # paInt16 is 2 bytes/sample
+        out = bytearray(leftover)
+        leftover.clear()
+        while len(out) < bytes_needed and pending_chunks:
+            out += pending_chunks.popleft()
+        if len(out) > bytes_needed:
+            leftover[:] = out[bytes_needed:]
+            del out[bytes_needed:]
+        elif len(out) < bytes_needed:
+            out += b"\x00" * (bytes_needed - len(out)) # Underflow: play silence.
+        return (bytes(out), pyaudio.paContinue)
+
+    return _playback_callback
+
 # --- WebSocket Connection Handler ---
 async def handler(websocket, path):
     """
@@ -55,19 +173,39 @@ async def handler(websocket, path):
     client_address = websocket.remote_address
     print(f"Client connected from {client_address}")
 
-    # Initialize PyAudio instance for this connection handler.
-    # Each handler gets its own PyAudio instance to manage its stream.
-    p = pyaudio.PyAudio()
+    # Disable Nagle's algorithm: the small, latency-sensitive audio frames
+    # should go out immediately instead of waiting to be coalesced (up to
+    # ~40 ms) with later ones.
+    try:
+        sock = websocket.transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except Exception as e:
+        print(f"Could not set TCP_NODELAY for {client_address}: {e}")
+
+    # All handlers share the process-wide PyAudio instance; only the stream
+    # below is per-connection.
+    p = _PA
     stream = None  # Initialize stream variable
+    # Tracked locally instead of calling stream.is_active() per message: that
+    # crosses into the PortAudio C layer every chunk, and this handler is the
+    # only place the stream is started or stopped anyway.
+    stream_active = False
+    pending_chunks = collections.deque(maxlen=PENDING_CHUNKS_MAX) # Received audio awaiting playback; bounded.
 
     try:
-        # Attempt to open an audio stream for playback.
+        # Attempt to open an audio stream for playback. Callback mode: the
+        # PortAudio thread pulls from pending_chunks, so receiving and
+        # playback are decoupled and the event loop never blocks on write.
         try:
             stream = p.open(format=FORMAT,
                             channels=CHANNELS,
                             rate=RATE,
                             output=True,  # This stream is for audio output (playback).
-                            frames_per_buffer=CHUNK)
+                            frames_per_buffer=CHUNK,
+                            stream_callback=make_playback_callback(pending_chunks))
+            stream.start_stream()
+            stream_active = True
             print(f"Audio output stream opened for client {client_address}")
         except Exception as e:
             # Log the error and terminate the handler if stream opening fails.
@@ -78,36 +216,22 @@ async def handler(websocket, path):
         # Main loop for receiving and processing messages from the client.
         async for message in websocket:
             try:
-                # Play received audio data.
+                # Queue received audio data for playback.
                 # Assumes 'message' is a chunk of raw audio data from the client.
-                if stream and stream.is_active():
-                    stream.write(message)
-                    # For debugging: print(f"Played back {len(message)} bytes from {client_address}.")
+                if stream and stream_active:
+                    pending_chunks.append(message)
+                    log.debug("Queued %d bytes from %s.", len(message), client_address)
                 else:
                     # This might occur if the stream was closed or became inactive unexpectedly.
                     print(f"Audio stream not active for {client_address}. Cannot play message.")
                     break  # Exit the message loop.
 
                 # --- Simulate Gemini Live processing and response ---
-                # This section generates a sine wave as a placeholder for a real response.
-                print(f"Simulating Gemini Live processing for client {client_address}...")
-
-                # Calculate the number of samples for the sine wave.
-                num_samples = int(SINE_DURATION * RATE)
-                # Create a time vector for the sine wave.
-                t = np.linspace(0, SINE_DURATION, num_samples, endpoint=False)
-                # Generate the sine wave. Amplitude 0.5 to avoid potential clipping.
-                sine_wave = 0.5 * np.sin(2 * np.pi * SINE_FREQUENCY * t)
-
-                # Convert the floating-point sine wave to 16-bit integer format.
-                # PyAudio paInt16 expects values in the range [-32768, 32767].
-                audio_data_int = (sine_wave * 32767).astype(np.int16)
-                # Convert the NumPy array of 16-bit integers to a byte string for sending.
-                audio_bytes = audio_data_int.tobytes()
-
-                # Send the simulated audio response back to the client.
-                await websocket.send(audio_bytes)
-                print(f"Sent {len(audio_bytes)} bytes of simulated audio response to {client_address}.")
+                # The placeholder sine wave is precomputed at module load
+                # (SINE_PCM), so responding is just one send call.
+                log.debug("Simulating Gemini Live processing for client %s...", client_address)
+                await websocket.send(SINE_PCM)
+                log.debug("Sent %d bytes of simulated audio response to %s.", len(SINE_PCM), client_address)
 
             except Exception as e:
                 # Handles errors during message processing (playback, sine generation, send).
@@ -134,15 +258,15 @@ async def handler(websocket, path):
         print(f"Cleaning up resources for client {client_address}...")
         if stream:
             try:
-                if stream.is_active():
+                if stream_active:
+                    stream_active = False
                     stream.stop_stream()  # Stop the stream if it's active.
                 stream.close()            # Close the stream.
                 print(f"Audio stream closed for {client_address}.")
             except Exception as e:
                 print(f"Error closing audio stream for {client_address}: {e}")
 
-        p.terminate()  # Terminate the PyAudio instance associated with this handler.
-        print(f"PyAudio instance terminated for {client_address}.")
+        # The shared PyAudio instance is terminated at process exit, not here.
         print(f"Connection handler for {client_address} finished.")
 
 # --- Main Server Logic ---
@@ -160,7 +284,10 @@ async def main():
             # - 'handler' is the function called for each new client connection.
             # - "0.0.0.0" means listen on all available network interfaces.
             # - 8765 is the port number.
-            server = await websockets.serve(handler, "0.0.0.0", 8765)
+            # compression=None: raw int16 PCM is high-entropy, so
+            # permessage-deflate burns CPU on every message for near-zero
+            # size reduction — a bad trade on a phone CPU.
+            server = await websockets.serve(handler, "0.0.0.0", 8765, compression=None)
             print("Server started successfully, listening on ws://0.0.0.0:8765")
             print("Waiting for client connections... Press Ctrl+C to stop the server.")
 
@@ -182,6 +309,9 @@ async def main():
 
 # Standard Python entry point.
 if __name__ == "__main__":
+    # INFO by default: per-message log.debug() calls above are filtered out
+    # before formatting. Drop to DEBUG manually when diagnosing audio flow.
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     print("Initializing server application...")
     try:
         # Run the main asynchronous function.
@@ -6,7 +6,30 @@ import websockets
 import threading
 import time
 import argparse
-import wave
+import collections
+import concurrent.futures
+import functools
+import logging
+import os
+import socket
+import struct
+
+# uvloop's libuv-based event loop roughly halves per-event overhead on the
+# send/recv hot path; it is optional (and unavailable on Windows), so fall
+# back to the stock asyncio loop when it is not installed.
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# sounddevice's RawInputStream hands the capture callback a raw C buffer —
+# no numpy conversion, no per-callback stream-object bookkeeping — which
+# keeps interpreter time inside the PortAudio high-priority thread to a
+# minimum. Optional: capture falls back to the PyAudio callback without it.
+try:
+    import sounddevice
+except ImportError:
+    sounddevice = None
 
 # --- Configuration ---
 ANDROID_PHONE_IP = "YOUR_ANDROID_PHONE_IP_ADDRESS"
@@ -16,59 +39,180 @@ FORMAT = pyaudio.paInt16
 CHANNELS = 1
 RATE = 44100
 CHUNK = 1024
+MIC_RING_CAPACITY = 1 << 18 # bytes (~3s of 16-bit mono at 44.1 kHz); power of two
+SEND_BATCH_CHUNKS = 4 # CHUNKs coalesced per WebSocket frame (~93 ms); bounds added latency.
+# Max bytes merged into one send (8 KiB at the current format). The sender
+# drains everything buffered since its last wake-up into a single frame, so
+# this cap is what keeps a backlog from turning into one huge high-latency
+# frame on a slow link; it also bounds per-send framing/syscall overhead to
+# one per ~4 chunks instead of one per chunk.
+SEND_COALESCE_MAX = SEND_BATCH_CHUNKS * CHUNK * 2 * CHANNELS
+# Cap on chunks queued for playback. The server can answer faster than the
+# speaker drains (every inbound frame gets a 0.5 s tone back), and with
+# callback-mode playback there is no blocking write left to throttle the
+# receive path, so an unbounded deque would grow — and playback latency with
+# it — for as long as the connection lasts. On overflow the deque drops its
+# oldest entries: playback skips ahead to recent audio rather than lagging.
+PLAYBACK_BUFFER_MAX_CHUNKS = 50
 
 # --- Global Variables ---
 CLIENT_LOG_PREFIX = "CLIENT_LOG:" # For consistent logging
+
+# Per-chunk diagnostics use a DEBUG-level logger (filtered out by default)
+# instead of print(), which takes the stdout lock and flushes ~43 times/s
+# in the audio loops. Status/lifecycle messages stay on print for the
+# harness's CLIENT_LOG parsing.
+log = logging.getLogger(__name__)
 audio_stream = None
+output_stream = None # Persistent speaker stream; opened once per session, survives reconnects.
+output_stream_active = False # Tracked flag, not per-chunk is_active() roundtrips.
+playback_jitter_buffer = None # deque feeding the playback callback.
 websocket_connection = None
 recording = False
 app_running = True
 args = None # Parsed command-line arguments
+mic_audio_ring = None # SpscRing, created per session by run_audio_and_websocket_loop
+mic_data_event = None # asyncio.Event the sender parks on while the ring is empty
+ws_ready = None # asyncio.Event: set while a live WebSocket connection exists
+ws_background_loop = None # Background thread's event loop, for call_soon_threadsafe
+save_segment_completed = False # True once a full --save-duration segment is on disk
 
 # Global PyAudio instance, initialized once and terminated once.
 p = pyaudio.PyAudio()
+SAMPLE_WIDTH = p.get_sample_size(FORMAT) # Constant for paInt16; looked up once.
+BYTES_PER_SECOND = RATE * SAMPLE_WIDTH * CHANNELS # For seconds<->bytes conversions.
+
+# Handle of the background worker thread, so the window-close handler can
+# join it — i.e. wait for its teardown to actually finish — instead of
+# sleeping a fixed grace period and hoping.
+worker_thread = None
 
 # --- GUI Elements (global for easy access by update functions) ---
 root = tk.Tk()
+# Cheap liveness flag for schedule_gui_update: winfo_exists() is a Tk/Tcl
+# round-trip per call, but we already know exactly when the window dies —
+# on_closing_main_window flips this just before destroy().
+root._exists = True
 root.title("PC Audio Client")
 root.geometry("400x250")
 
 # --- Thread-Safe GUI Update Function ---
 def schedule_gui_update(root_tk_instance, callable_to_run, **kwargs_for_callable):
     """Schedules a callable for execution on the main Tkinter thread."""
-    if root_tk_instance and root_tk_instance.winfo_exists():
-        root_tk_instance.after(0, lambda: callable_to_run(**kwargs_for_callable))
-    else:
-        if root_tk_instance and root_tk_instance.winfo_exists() and app_running:
-             print(f"{CLIENT_LOG_PREFIX} [WARN] GUI update scheduled but root window is gone or invalid.")
+    # The _exists flag replaces winfo_exists() — a Tcl round-trip per call —
+    # since on_closing_main_window clears it right before destroying the root.
+    if root_tk_instance is not None and getattr(root_tk_instance, "_exists", False):
+        # functools.partial is a C-level callable (no per-update Python lambda
+        # closure), and after_idle defers to when the main loop is idle, which
+        # naturally coalesces bursts of updates while Tk is busy.
+        root_tk_instance.after_idle(functools.partial(callable_to_run, **kwargs_for_callable))
+    elif app_running:
+        print(f"{CLIENT_LOG_PREFIX} [WARN] GUI update scheduled but root window is gone or invalid.")
 
 status_label = tk.Label(root, text="Status: Ready", font=("Arial", 12))
 status_label.pack(pady=10)
 
-# --- Helper function to save audio data to WAV file ---
-def save_buffered_audio_to_wav(filename, audio_data_bytes, channels, sample_width, rate):
-    """Saves a byte string of audio data to a WAV file."""
+_last_status_text = [""] # Last text scheduled for the status label.
+
+def set_status(text):
+    """Schedules a status-label update, skipping repeats of the current text.
+
+    The send/receive tasks can push the same status dozens of times per second
+    during network hiccups; each Tcl config() call re-resolves options and
+    repaints, so identical updates are dropped here before they reach Tk.
+    """
+    if text != _last_status_text[0]:
+        _last_status_text[0] = text
+        schedule_gui_update(root, status_label.config, text=text)
+
+# --- Helper functions for saving received audio to a WAV file ---
+# RIFF/WAVE/fmt/data header layout for uncompressed PCM, 44 bytes total.
+_WAV_HEADER_STRUCT = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+class RawWavWriter:
+    """Minimal incremental WAV writer over a raw file descriptor.
+
+    The format here is always uncompressed PCM, so the 44-byte header is one
+    struct.pack and each chunk is one os.write — no wave-module attribute
+    lookups, namedtuple construction, or buffered-IO layer per call. The
+    header is written with zero sizes up front and patched on close, same as
+    wave.Wave_write does.
+    """
+    def __init__(self, filename, channels, sample_width, rate):
+        self._channels = channels
+        self._sample_width = sample_width
+        self._rate = rate
+        self._data_bytes = 0
+        # First write failure (disk full, bad fd, ...). The save-path writes
+        # run on an executor whose futures nobody awaits, so errors must be
+        # recorded here for close_save_wav to report instead of vanishing as
+        # unretrieved future exceptions.
+        self.error = None
+        self._fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.write(self._fd, self._header(0))
+
+    def _header(self, data_len):
+        block_align = self._channels * self._sample_width
+        return _WAV_HEADER_STRUCT.pack(
+            b'RIFF', 36 + data_len, b'WAVE',
+            b'fmt ', 16, 1, self._channels, self._rate,
+            self._rate * block_align, block_align, 8 * self._sample_width,
+            b'data', data_len)
+
+    def writeframes(self, data):
+        """Appends raw PCM frames (API-compatible with wave.Wave_write)."""
+        if self.error is not None:
+            return # A write already failed; don't pile further errors on.
+        try:
+            written = os.write(self._fd, data)
+            while written < len(data): # Partial writes are rare on regular files.
+                written += os.write(self._fd, data[written:])
+            self._data_bytes += written
+        except OSError as e:
+            self.error = e
+
+    def close(self):
+        """Patches the RIFF/data sizes in the header and closes the fd."""
+        try:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.write(self._fd, self._header(self._data_bytes))
+        except OSError as e:
+            if self.error is None:
+                self.error = e
+        finally:
+            os.close(self._fd)
+
+def open_save_wav(filename, channels, sample_width, rate):
+    """Opens a WAV file for incremental writing; returns the writer or None."""
+    global CLIENT_LOG_PREFIX
+    try:
+        return RawWavWriter(filename, channels, sample_width, rate)
+    except Exception as e:
+        base_filename = os.path.basename(filename)
+        print(f"{CLIENT_LOG_PREFIX} [ERROR] Failed to open {filename} for saving received audio: {e}")
+        set_status(f"Status: Error saving to {base_filename}")
+        return None
+
+def close_save_wav(wf, filename):
+    """Finalizes an incrementally written WAV file and reports the result."""
     global args, root, status_label, CLIENT_LOG_PREFIX
     try:
-        wf = wave.open(filename, 'wb')
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(rate)
-        wf.writeframes(audio_data_bytes)
-        wf.close()
+        wf.close() # Patches the RIFF/data chunk sizes in the header.
+        if wf.error is not None:
+            raise wf.error # Surface the first failed write instead of claiming success.
         duration_text = f"~{args.save_duration}s" if args and hasattr(args, 'save_duration') else "segment"
         print(f"{CLIENT_LOG_PREFIX} [INFO] Successfully saved {duration_text} of received audio to {filename}")
-        base_filename = filename.split('/')[-1].split('\\')[-1] # Show only filename in GUI
-        schedule_gui_update(root, status_label.config, text=f"Status: Saved audio to {base_filename}")
+        base_filename = os.path.basename(filename) # Show only filename in GUI
+        set_status(f"Status: Saved audio to {base_filename}")
     except Exception as e:
-        base_filename = filename.split('/')[-1].split('\\')[-1]
+        base_filename = os.path.basename(filename)
         print(f"{CLIENT_LOG_PREFIX} [ERROR] Failed to save received audio to {filename}: {e}")
-        schedule_gui_update(root, status_label.config, text=f"Status: Error saving to {base_filename}")
+        set_status(f"Status: Error saving to {base_filename}")
 
 # --- GUI Control Functions ---
 def start_recording_wrapper():
     """Handles 'Start Streaming' button click: sets flags and starts the main background thread."""
-    global recording, app_running, root, status_label, start_button, stop_button, CLIENT_LOG_PREFIX
+    global recording, app_running, worker_thread, root, status_label, start_button, stop_button, CLIENT_LOG_PREFIX
     print(f"{CLIENT_LOG_PREFIX} [INFO] Start recording/streaming requested.")
     if recording:
         print(f"{CLIENT_LOG_PREFIX} [DEBUG] Start request ignored, already recording.")
@@ -77,12 +221,13 @@ def start_recording_wrapper():
     recording = True
     app_running = True
 
-    schedule_gui_update(root, status_label.config, text="Status: Initializing...")
+    set_status("Status: Initializing...")
     schedule_gui_update(root, start_button.config, state=tk.DISABLED)
     schedule_gui_update(root, stop_button.config, state=tk.NORMAL)
 
     # Main operations (audio and WebSocket) run in a separate thread to keep GUI responsive.
-    threading.Thread(target=run_audio_and_websocket_loop, daemon=True).start()
+    worker_thread = threading.Thread(target=run_audio_and_websocket_loop, daemon=True)
+    worker_thread.start()
 
 def stop_recording_wrapper():
     """Handles 'Stop Streaming' button click: sets flags to terminate background operations."""
@@ -93,155 +238,333 @@ def stop_recording_wrapper():
         print(f"{CLIENT_LOG_PREFIX} [DEBUG] Stop request ignored, already stopped or stopping.")
         return
 
-    schedule_gui_update(root, status_label.config, text="Status: Stopping...")
+    set_status("Status: Stopping...")
     schedule_gui_update(root, stop_button.config, state=tk.DISABLED)
 
     recording = False
     app_running = False
 
+    # Wake the sender if it is parked on the ring-empty event so it notices
+    # the cleared flags immediately instead of waiting for the next mic chunk.
+    _wake_sender()
+
 
 # --- Audio Processing and WebSocket Communication (executed in a background thread) ---
+class SpscRing:
+    """Fixed-capacity single-producer/single-consumer byte ring buffer.
+
+    The PortAudio callback thread is the only producer and the sender side the
+    only consumer, so head and tail are each advanced by exactly one thread and
+    int loads/stores are atomic under the GIL — the data path needs no lock and
+    allocates nothing per chunk. Capacity must be a power of two.
+    """
+    def __init__(self, capacity):
+        assert capacity & (capacity - 1) == 0, "capacity must be a power of two"
+        self._buf = bytearray(capacity)
+        self._mask = capacity - 1
+        self._head = 0 # Total bytes ever written (producer only).
+        self._tail = 0 # Total bytes ever read (consumer only).
+        # Wake-up signalling lives with the callers (mic_data_event), keeping
+        # the ring itself a pure data structure.
+
+    def put(self, data):
+        """Producer side: appends data, or returns False (dropping it) when full."""
+        n = len(data)
+        if n > len(self._buf) - (self._head - self._tail):
+            return False # Ring full: drop rather than block the audio thread.
+        src = memoryview(data) # Views slice without copying, unlike bytes.
+        pos = self._head & self._mask
+        first = min(n, len(self._buf) - pos)
+        self._buf[pos:pos + first] = src[:first]
+        if first < n: # Wrapped around the end of the buffer.
+            self._buf[0:n - first] = src[first:]
+        self._head += n
+        return True
+
+    def get(self, max_bytes):
+        """Consumer side: returns up to max_bytes as a bytearray, or b'' when empty.
+
+        The result is exactly one copy out of the ring into a fresh buffer
+        (websockets sends any bytes-like object as a BINARY frame, so no
+        bytes() conversion is needed on top).
+        """
+        available = self._head - self._tail
+        n = min(available, max_bytes)
+        if n <= 0:
+            return b""
+        pos = self._tail & self._mask
+        first = min(n, len(self._buf) - pos)
+        src = memoryview(self._buf)
+        if first < n: # Wrapped: fill one pre-sized slab, no intermediate slices.
+            out = bytearray(n)
+            out[:first] = src[pos:pos + first]
+            out[first:] = src[:n - first]
+        else:
+            out = bytearray(src[pos:pos + n])
+        self._tail += n
+        return out
+
+def _wake_sender():
+    """Wakes the sender coroutine from any thread via its loop's scheduler.
+
+    call_soon_threadsafe is one self-pipe write — no Future, no coroutine
+    object — and callers skip it entirely when the event is already set, so a
+    steady stream of mic chunks costs at most one wake-up per sender nap.
+    """
+    loop = ws_background_loop
+    event = mic_data_event
+    if loop is None or event is None or event.is_set():
+        return
+    try:
+        loop.call_soon_threadsafe(event.set)
+    except RuntimeError:
+        pass # Loop already closed during shutdown; nothing left to wake.
+
+def make_playback_callback(jitter_buffer):
+    """Builds a PortAudio output callback fed from a deque jitter buffer.
+
+    The receive coroutine only appends chunks to 'jitter_buffer'; the
+    PortAudio thread pulls from it here, so playback never blocks the asyncio
+    event loop. On underflow the callback emits silence and keeps the stream
+    alive. deque.append/popleft are atomic under the GIL, so this SPSC pair
+    needs no extra locking.
+    """
+    leftover = bytearray() # Partial chunk carried over between callbacks.
+
+    def _playback_callback(_in_data, frame_count, _time_info, _status):
+        bytes_needed = frame_count * CHANNELS * 2 # paInt16 is 2 bytes/sample
+        out = bytearray(leftover)
+        leftover.clear()
+        while len(out) < bytes_needed and jitter_buffer:
+            out += jitter_buffer.popleft()
+        if len(out) > bytes_needed:
+            leftover[:] = out[bytes_needed:]
+            del out[bytes_needed:]
+        elif len(out) < bytes_needed:
+            out += b"\x00" * (bytes_needed - len(out)) # Underflow: play silence.
+        return (bytes(out), pyaudio.paContinue)
+
+    return _playback_callback
+
 def audio_callback(in_data, frame_count, time_info, status_flags):
     """PyAudio callback: Called by PortAudio thread when new audio data is available."""
-    global audio_buffer_queue, CLIENT_LOG_PREFIX
+    global mic_audio_ring, CLIENT_LOG_PREFIX
     if recording and app_running:
         try:
-            # Get the asyncio event loop of the background thread.
-            loop = getattr(threading.current_thread(), 'websocket_loop', None)
-            if loop and loop.is_running():
-                # Thread-safely put audio data into the asyncio queue.
-                asyncio.run_coroutine_threadsafe(audio_buffer_queue.put(in_data), loop)
-            # else: # Can be noisy during shutdown
-                # print(f"{CLIENT_LOG_PREFIX} [DEBUG] Audio callback: Loop not running/found.")
+            # Wait-free hand-off to the sender task: no coroutine, no Future.
+            # The wake-up below is a no-op unless the sender is actually
+            # parked, so the common case is one deque-free ring write.
+            if mic_audio_ring.put(in_data):
+                _wake_sender()
         except Exception as e:
             print(f"{CLIENT_LOG_PREFIX} [ERROR] Audio callback error: {e}")
         return (in_data, pyaudio.paContinue) # Tell PyAudio to continue streaming.
     else:
         return (None, pyaudio.paComplete) # Tell PyAudio to stop the stream.
 
+def sd_input_callback(indata, _frames, _time_info, _status):
+    """sounddevice capture callback: copies the raw C buffer into the mic ring.
+
+    'indata' is a CFFI buffer owned by PortAudio and only valid for the
+    duration of the call; SpscRing.put copies it out synchronously, so no
+    bytes object is created for it on the realtime thread.
+    """
+    if recording and app_running:
+        if mic_audio_ring.put(indata):
+            _wake_sender()
+
+def read_audio_from_fd_loop(audio_fd):
+    """Reads raw PCM from an inherited pipe fd and enqueues it like the mic callback.
+
+    Used by the test harness (--audio-fd) to inject audio directly over a pipe
+    instead of relying on PyAudio capture plus an OS-level loopback cable.
+    Runs in its own thread; exits on EOF or when the app shuts down.
+    """
+    global mic_audio_ring, CLIENT_LOG_PREFIX
+    chunk_bytes = CHUNK * 2 * CHANNELS # paInt16 is 2 bytes per sample
+    try:
+        while recording and app_running:
+            data = os.read(audio_fd, chunk_bytes)
+            if not data: # EOF: harness closed its end of the pipe.
+                print(f"{CLIENT_LOG_PREFIX} [INFO] Test audio fd reached EOF; stopping fd reader.")
+                break
+            while not mic_audio_ring.put(data) and recording and app_running:
+                time.sleep(0.01) # Ring full: unlike the mic path, pipe input can wait.
+            _wake_sender()
+    except OSError as e:
+        print(f"{CLIENT_LOG_PREFIX} [ERROR] Error reading from test audio fd {audio_fd}: {e}")
+    finally:
+        try: os.close(audio_fd)
+        except OSError: pass
+
 async def send_audio_to_websocket():
-    """Coroutine: Gets audio from queue and sends it over WebSocket."""
-    global websocket_connection, recording, app_running, root, status_label, audio_buffer_queue, CLIENT_LOG_PREFIX
+    """Coroutine: Gets audio from the mic ring buffer and sends it over WebSocket.
+
+    Every await in here is a plain cancellable wait (no wait_for timeouts, so
+    no TimerHandle/Task churn); manager cancellation is the normal exit path
+    alongside ConnectionClosed.
+    """
+    global websocket_connection, recording, app_running, root, status_label, mic_audio_ring, CLIENT_LOG_PREFIX
     print(f"{CLIENT_LOG_PREFIX} [INFO] Send audio task started.")
     try:
         while app_running:
             if websocket_connection and recording:
                 try:
-                    data = await asyncio.wait_for(audio_buffer_queue.get(), timeout=0.1)
-                    if data:
-                        await websocket_connection.send(data)
-                        print(f"{CLIENT_LOG_PREFIX} [DEBUG] Sent audio chunk of {len(data)} bytes.")
-                    audio_buffer_queue.task_done()
-                except asyncio.TimeoutError: # Normal if queue is empty
-                    continue
+                    # Drain-and-coalesce: grab everything buffered since the
+                    # last send (capped) so back-to-back chunks share one
+                    # WebSocket frame instead of paying framing per CHUNK.
+                    data = mic_audio_ring.get(SEND_COALESCE_MAX)
+                    if not data:
+                        # Ring empty: park on the asyncio event until a
+                        # producer (or a stop handler) wakes us via
+                        # call_soon_threadsafe. Clear first, then re-check the
+                        # ring so a put() racing the clear is never lost.
+                        mic_data_event.clear()
+                        data = mic_audio_ring.get(SEND_COALESCE_MAX)
+                        if not data:
+                            await mic_data_event.wait()
+                            continue
+                    await websocket_connection.send(data)
+                    log.debug("%s [DEBUG] Sent audio chunk of %d bytes.", CLIENT_LOG_PREFIX, len(data))
                 except websockets.exceptions.ConnectionClosed as e:
                     print(f"{CLIENT_LOG_PREFIX} [WARN] WebSocket connection closed during send: {e}")
-                    schedule_gui_update(root, status_label.config, text="Status: Connection lost (send).")
+                    set_status("Status: Connection lost (send).")
                     websocket_connection = None
+                    ws_ready.clear() # So the peer task parks rather than spins.
                     break # Exit task, manager will handle reconnection.
                 except Exception as e:
                     print(f"{CLIENT_LOG_PREFIX} [ERROR] Error sending audio via WebSocket: {e}")
-                    schedule_gui_update(root, status_label.config, text="Status: Error sending audio.")
+                    set_status("Status: Error sending audio.")
                     await asyncio.sleep(0.1)
             elif not app_running:
                 break
             else:
-                await asyncio.sleep(0.01) # Wait if not recording or no connection.
+                # No connection: park until the manager signals one is up
+                # instead of polling 100 times a second.
+                await ws_ready.wait()
     finally:
         print(f"{CLIENT_LOG_PREFIX} [INFO] Send audio task finishing.")
 
 async def receive_audio_from_websocket():
-    """Coroutine: Receives audio from WebSocket, plays it, and optionally saves it."""
-    global websocket_connection, app_running, p, root, status_label, args, RATE, FORMAT, CHANNELS, CLIENT_LOG_PREFIX
-    output_stream_local = None
+    """Coroutine: Receives audio from WebSocket, plays it, and optionally saves it.
+
+    Like the sender, all waits are plain cancellable awaits; the manager's
+    task.cancel() on shutdown or reconnect is the expected way out, and the
+    finally block below covers cleanup for that path too.
+    """
+    global websocket_connection, app_running, p, root, status_label, args, RATE, FORMAT, CHANNELS, CLIENT_LOG_PREFIX, save_segment_completed
+    # The speaker stream and its jitter buffer are opened once per session by
+    # run_audio_and_websocket_loop and survive this task being cancelled and
+    # recreated on reconnect: PortAudio stream open costs tens of ms (device
+    # enumeration, buffer-processor init), during which the first frames after
+    # a network blip would otherwise be dropped.
     is_saving_audio_active_session = False
-    saved_frames_this_session = 0
-    max_frames_to_save_this_session = 0
-    audio_buffer_for_saving = []
-    sample_width = p.get_sample_size(FORMAT)
-
-    if args and args.save_received_audio:
+    save_wf = None # Incremental WAV writer for received audio.
+    save_pos = 0 # Bytes written to save_wf so far.
+    save_target_bytes = 0
+    save_executor = None # Single worker serializing the save-path disk writes.
+    if args and args.save_received_audio and not save_segment_completed:
+        # Arm saving, but open the file lazily on the first received chunk:
+        # this task is recreated on every reconnect, and opening (O_TRUNC)
+        # here would wipe whatever is already on disk even if the new
+        # connection never delivers a byte. Once a full segment has been
+        # saved, save_segment_completed keeps reconnects from re-arming and
+        # overwriting the finished file.
         is_saving_audio_active_session = True
-        max_frames_to_save_this_session = args.save_duration * RATE
+        save_target_bytes = args.save_duration * BYTES_PER_SECOND
         print(f"{CLIENT_LOG_PREFIX} [INFO] Will save up to {args.save_duration}s of received audio to {args.save_received_audio}")
 
     print(f"{CLIENT_LOG_PREFIX} [INFO] Receive audio task started.")
     try:
-        try:
-            output_stream_local = p.open(format=FORMAT, channels=CHANNELS, rate=RATE, output=True, frames_per_buffer=CHUNK)
-            print(f"{CLIENT_LOG_PREFIX} [STATUS] Speaker stream opened for received audio.")
-        except IOError as e:
-            print(f"{CLIENT_LOG_PREFIX} [ERROR] PyAudio Error (Output): {e}")
-            error_str = str(e).lower()
-            user_msg = "Error: Could not open speaker. Check audio settings."
-            if "invalid output device" in error_str or "no default output device" in error_str:
-                user_msg = "Error: No speaker found or invalid output device."
-            elif "device unavailable" in error_str or "device or resource busy" in error_str:
-                user_msg = "Error: Speaker is busy or unavailable."
-            print(f"{CLIENT_LOG_PREFIX} [ERROR] Failed to open speaker: {user_msg}")
-            schedule_gui_update(root, status_label.config, text=user_msg)
-            return
-        except Exception as e:
-            print(f"{CLIENT_LOG_PREFIX} [ERROR] Fatal: Unexpected error opening output audio stream: {e}")
-            schedule_gui_update(root, status_label.config, text="Status: Error - Cannot play audio (unexpected).")
-            return
-
         while app_running:
             if websocket_connection:
                 try:
-                    data = await asyncio.wait_for(websocket_connection.recv(), timeout=0.1)
+                    # Block natively on the protocol's receive queue; the
+                    # manager cancels this task on shutdown/reconnect, so no
+                    # timeout polling (and its per-iteration Future) is needed.
+                    data = await websocket_connection.recv()
                     if data: # If data is not None or empty
-                        if output_stream_local and output_stream_local.is_active():
-                            output_stream_local.write(data)
-                            print(f"{CLIENT_LOG_PREFIX} [DEBUG] Played received audio chunk of {len(data)} bytes.")
-
+                        chunk_len = len(data)
+                        # Playback and saving share this one bytes object by
+                        # reference — no copy per consumer — and playback is
+                        # callback-driven, so a backpressuring speaker never
+                        # holds the GIL against the network receive.
+                        if output_stream and output_stream_active:
+                            playback_jitter_buffer.append(data)
+                            log.debug("%s [DEBUG] Queued received audio chunk of %d bytes for playback.", CLIENT_LOG_PREFIX, chunk_len)
+
+                        if is_saving_audio_active_session and save_wf is None:
+                            # First chunk of this save attempt: only now is it
+                            # worth (re)creating the file. Stream chunks
+                            # straight to disk from here on: memory use stays
+                            # constant regardless of save_duration, and disk
+                            # I/O overlaps with the network receive.
+                            save_wf = open_save_wav(args.save_received_audio, CHANNELS, SAMPLE_WIDTH, RATE)
+                            if save_wf is None:
+                                is_saving_audio_active_session = False # Open failed (already reported).
+                            else:
+                                # The actual os.write calls run on this one
+                                # worker thread, not the event loop, so a slow
+                                # or syncing filesystem can never stall recv; a
+                                # single worker keeps the writes ordered.
+                                save_executor = concurrent.futures.ThreadPoolExecutor(
+                                    max_workers=1, thread_name_prefix="wav-save")
                         if is_saving_audio_active_session:
-                            audio_buffer_for_saving.append(data)
-                            frames_in_chunk = len(data) // (sample_width * CHANNELS)
-                            saved_frames_this_session += frames_in_chunk
-
-                            if saved_frames_this_session >= max_frames_to_save_this_session:
-                                print(f"{CLIENT_LOG_PREFIX} [INFO] Collected approximately {args.save_duration}s of audio for {args.save_received_audio}. Saving now...")
-                                all_audio_bytes = b''.join(audio_buffer_for_saving)
-                                save_buffered_audio_to_wav(
-                                    args.save_received_audio,
-                                    all_audio_bytes, CHANNELS,
-                                    sample_width, RATE
-                                )
-                                audio_buffer_for_saving = []
-                                is_saving_audio_active_session = False # Stop collecting for this session
-                except asyncio.TimeoutError: # Normal if no data received
-                    continue
+                            take = min(chunk_len, save_target_bytes - save_pos)
+                            # Hand the chunk over by reference; no copy unless
+                            # it straddles the save boundary.
+                            save_executor.submit(
+                                save_wf.writeframes,
+                                data[:take] if take < chunk_len else data)
+                            save_pos += take
+                        # Drop this coroutine's reference right away: the jitter
+                        # buffer now owns the chunk, so once the playback callback
+                        # pops it the allocator can reuse the slot instead of the
+                        # bytes lingering until the next recv() rebinds 'data'.
+                        del data
+                        if is_saving_audio_active_session and save_pos >= save_target_bytes:
+                            print(f"{CLIENT_LOG_PREFIX} [INFO] Collected approximately {args.save_duration}s of audio for {args.save_received_audio}. Saving now...")
+                            # Queued behind the pending writes, so it runs
+                            # once the last frame is on disk.
+                            save_executor.submit(close_save_wav, save_wf, args.save_received_audio)
+                            save_executor.shutdown(wait=False)
+                            save_executor = None
+                            save_wf = None
+                            is_saving_audio_active_session = False # Stop collecting for this session
+                            save_segment_completed = True # Don't re-arm (and re-truncate) on reconnect.
                 except websockets.exceptions.ConnectionClosed as e:
                     print(f"{CLIENT_LOG_PREFIX} [WARN] WebSocket connection closed during receive: {e}")
-                    schedule_gui_update(root, status_label.config, text="Status: Connection lost (receive).")
+                    set_status("Status: Connection lost (receive).")
                     websocket_connection = None
+                    ws_ready.clear() # So the peer task parks rather than spins.
                     break # Exit task, manager will handle.
                 except Exception as e:
                     print(f"{CLIENT_LOG_PREFIX} [ERROR] Error receiving/playing audio from WebSocket: {e}")
-                    schedule_gui_update(root, status_label.config, text="Status: Error receiving audio.")
+                    set_status("Status: Error receiving audio.")
                     await asyncio.sleep(0.1)
             elif not app_running:
                 break
-            else: # No connection
-                await asyncio.sleep(0.01)
+            else: # No connection: park until the manager signals one is up.
+                await ws_ready.wait()
     finally:
-        if output_stream_local:
-            try:
-                if output_stream_local.is_active(): output_stream_local.stop_stream()
-                output_stream_local.close()
-                print(f"{CLIENT_LOG_PREFIX} [INFO] Output audio stream (for received audio) closed.")
-            except Exception as e: print(f"{CLIENT_LOG_PREFIX} [ERROR] Error closing output stream for received audio: {e}")
-
-        # Save any remaining buffered audio if saving was active and cut short
-        if args and args.save_received_audio and len(audio_buffer_for_saving) > 0 and is_saving_audio_active_session:
-            print(f"{CLIENT_LOG_PREFIX} [INFO] Task ending. Saving partially collected audio to {args.save_received_audio}.")
-            all_audio_bytes = b''.join(audio_buffer_for_saving)
-            save_buffered_audio_to_wav(
-                args.save_received_audio, all_audio_bytes,
-                CHANNELS, sample_width, RATE
-            )
-            audio_buffer_for_saving = []
+        # The speaker stream deliberately stays open here: it belongs to the
+        # session (run_audio_and_websocket_loop closes it), not to this task,
+        # so a reconnect resumes playback with zero device-open latency.
+
+        # Finalize the WAV file if saving was active and cut short; the frames
+        # themselves are already on disk, close() just patches the header.
+        if save_wf is not None and is_saving_audio_active_session:
+            if save_pos > 0:
+                print(f"{CLIENT_LOG_PREFIX} [INFO] Task ending. Saving partially collected audio to {args.save_received_audio}.")
+            save_executor.submit(close_save_wav, save_wf, args.save_received_audio)
+            # wait=True: the manager awaits this task before starting its
+            # replacement, so blocking here until the queued writes and the
+            # header patch have landed guarantees the old writer can never
+            # scribble a stale header over a file the next attempt reopens.
+            # The queue holds at most a few small buffered writes.
+            save_executor.shutdown(wait=True)
+            save_executor = None
+            save_wf = None
     print(f"{CLIENT_LOG_PREFIX} [INFO] Receive audio task finishing.")
 
 async def websocket_client_manager():
@@ -256,18 +579,40 @@ async def websocket_client_manager():
     while app_running:
         if not websocket_connection:
             if current_retry_delay == INITIAL_RETRY_DELAY: # Only show "Connecting..." on first attempt post-disconnect
-                 schedule_gui_update(root, status_label.config, text=f"Status: Connecting to {ANDROID_PHONE_IP}...")
+                 set_status(f"Status: Connecting to {ANDROID_PHONE_IP}...")
             print(f"{CLIENT_LOG_PREFIX} [INFO] Attempting WebSocket connection to ws://{ANDROID_PHONE_IP}:{ANDROID_PHONE_PORT}")
             try:
-                ws_connect_coro = websockets.connect(f"ws://{ANDROID_PHONE_IP}:{ANDROID_PHONE_PORT}", open_timeout=5)
-                websocket_connection = await asyncio.wait_for(ws_connect_coro, timeout=6.0)
+                # compression=None: PCM audio is incompressible, so
+                # permessage-deflate would only add CPU per message. We only
+                # ever exchange BINARY frames, so no UTF-8 validation runs
+                # on this path either.
+                # ping_interval/ping_timeout: the library keeps the link alive
+                # and detects dead peers itself, so the manager no longer runs
+                # its own ping loop.
+                # max_size/max_queue: frames here are <=8 KiB of PCM, so 1 MiB
+                # is ample and a short receive queue bounds buffering if the
+                # receive task ever lags the network.
+                websocket_connection = await websockets.connect(
+                    f"ws://{ANDROID_PHONE_IP}:{ANDROID_PHONE_PORT}",
+                    open_timeout=5, ping_interval=5, ping_timeout=3,
+                    compression=None, max_size=2**20, max_queue=32)
                 print(f"{CLIENT_LOG_PREFIX} [STATUS] WebSocket connection established.")
 
+                # Disable Nagle's algorithm on the new connection: audio chunks
+                # are small and latency-sensitive, so they should not sit in
+                # the kernel waiting to be coalesced with later writes.
+                try:
+                    sock = websocket_connection.transport.get_extra_info("socket")
+                    if sock is not None:
+                        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                except Exception as e_nodelay:
+                    print(f"{CLIENT_LOG_PREFIX} [WARN] Could not set TCP_NODELAY: {e_nodelay}")
+
                 # Set status based on whether saving is active
                 if args and args.save_received_audio:
-                    schedule_gui_update(root, status_label.config, text=f"Status: Connected (Saving to {args.save_received_audio.split('/')[-1]})")
+                    set_status(f"Status: Connected (Saving to {args.save_received_audio.split('/')[-1]})")
                 else:
-                    schedule_gui_update(root, status_label.config, text="Status: Connected. Streaming...")
+                    set_status("Status: Connected. Streaming...")
 
                 current_retry_delay = INITIAL_RETRY_DELAY # Reset on success
 
@@ -279,51 +624,52 @@ async def websocket_client_manager():
 
                 send_task = asyncio.create_task(send_audio_to_websocket())
                 receive_task = asyncio.create_task(receive_audio_from_websocket())
+                ws_ready.set() # Unpark anything waiting for a live connection.
             except asyncio.TimeoutError:
                 msg = f"Status: Connection timed out. Retrying in {int(current_retry_delay)}s..."
                 print(f"{CLIENT_LOG_PREFIX} [ERROR] WebSocket connection to ws://{ANDROID_PHONE_IP}:{ANDROID_PHONE_PORT} timed out. Retrying in {int(current_retry_delay)}s...")
-                schedule_gui_update(root, status_label.config, text=msg)
+                set_status(msg)
                 websocket_connection = None
                 await asyncio.sleep(current_retry_delay)
                 current_retry_delay = min(current_retry_delay * 2, MAX_RETRY_DELAY)
             except websockets.exceptions.ConnectionRefusedError as e:
                 msg = f"Status: Connection refused. Retrying in {int(current_retry_delay)}s..."
                 print(f"{CLIENT_LOG_PREFIX} [ERROR] WebSocket connection refused by server (ws://{ANDROID_PHONE_IP}:{ANDROID_PHONE_PORT}). Retrying in {int(current_retry_delay)}s...")
-                schedule_gui_update(root, status_label.config, text=msg)
+                set_status(msg)
                 websocket_connection = None
                 await asyncio.sleep(current_retry_delay)
                 current_retry_delay = min(current_retry_delay * 2, MAX_RETRY_DELAY)
             except OSError as e: # Catches host not found, network unreachable, etc.
                 msg = f"Status: Network error ({type(e).__name__}). Retrying in {int(current_retry_delay)}s..."
                 print(f"{CLIENT_LOG_PREFIX} [ERROR] WebSocket OS error ({type(e).__name__}: {e}) for ws://{ANDROID_PHONE_IP}:{ANDROID_PHONE_PORT}. Retrying in {int(current_retry_delay)}s...")
-                schedule_gui_update(root, status_label.config, text=msg)
+                set_status(msg)
                 websocket_connection = None
                 await asyncio.sleep(current_retry_delay)
                 current_retry_delay = min(current_retry_delay * 2, MAX_RETRY_DELAY)
             except Exception as e:
                 msg = f"Status: Connection error. Retrying in {int(current_retry_delay)}s..."
                 print(f"{CLIENT_LOG_PREFIX} [ERROR] Unexpected WebSocket connection error ({type(e).__name__}: {e}) for ws://{ANDROID_PHONE_IP}:{ANDROID_PHONE_PORT}. Retrying in {int(current_retry_delay)}s...")
-                schedule_gui_update(root, status_label.config, text=msg)
+                set_status(msg)
                 websocket_connection = None
                 await asyncio.sleep(current_retry_delay)
                 current_retry_delay = min(current_retry_delay * 2, MAX_RETRY_DELAY)
-        else: # If connection exists, ping it
-            try:
-                await asyncio.wait_for(websocket_connection.ping(), timeout=3.0)
-                current_retry_delay = INITIAL_RETRY_DELAY # Reset if ping successful
-            except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed) as e:
-                print(f"{CLIENT_LOG_PREFIX} [WARN] WebSocket ping failed or connection closed ({type(e).__name__}). Attempting to reconnect...")
-                schedule_gui_update(root, status_label.config, text=f"Status: Connection lost. Retrying in {int(current_retry_delay)}s...")
-                websocket_connection = None
-                if send_task and not send_task.done(): send_task.cancel()
-                if receive_task and not receive_task.done(): receive_task.cancel()
-            except Exception as e: # Other errors during ping
-                print(f"{CLIENT_LOG_PREFIX} [ERROR] Error during WebSocket ping: {e}. Assuming connection lost.")
-                schedule_gui_update(root, status_label.config, text=f"Status: Connection error (ping). Retrying in {int(current_retry_delay)}s...")
-                websocket_connection = None
+        else: # Connection exists: wait for something to actually happen.
+            # Link health is now policed by the library's keepalive (see the
+            # ping_interval/ping_timeout connect arguments), so instead of
+            # waking every second to ping, just sleep until either sub-task
+            # finishes: they exit on ConnectionClosed (keepalive failure
+            # included) or on shutdown. Zero wake-ups while streaming.
+            pending_tasks = [t for t in (send_task, receive_task) if t and not t.done()]
+            if pending_tasks:
+                await asyncio.wait(pending_tasks, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(1) # Both sub-tasks already gone; idle until retry/shutdown.
+            if app_running and not websocket_connection:
+                ws_ready.clear() # Normally already cleared by the task that saw the close.
+                print(f"{CLIENT_LOG_PREFIX} [WARN] WebSocket connection lost. Attempting to reconnect...")
+                set_status(f"Status: Connection lost. Retrying in {int(current_retry_delay)}s...")
                 if send_task and not send_task.done(): send_task.cancel()
                 if receive_task and not receive_task.done(): receive_task.cancel()
-            await asyncio.sleep(1) # Interval for pinging active connection
 
     # Shutdown sequence for the manager
     print(f"{CLIENT_LOG_PREFIX} [INFO] WebSocket client manager initiating shutdown...")
@@ -344,17 +690,38 @@ async def websocket_client_manager():
 
 def run_audio_and_websocket_loop():
     """Main function for the background thread: sets up asyncio loop and runs the WebSocket manager."""
-    global audio_stream, app_running, p, root, status_label, start_button, stop_button, audio_buffer_queue, CLIENT_LOG_PREFIX
-    audio_buffer_queue = asyncio.Queue()
-    loop = asyncio.new_event_loop()
+    global audio_stream, output_stream, output_stream_active, playback_jitter_buffer, app_running, p, root, status_label, start_button, stop_button, mic_audio_ring, mic_data_event, ws_ready, ws_background_loop, CLIENT_LOG_PREFIX, save_segment_completed
+    mic_audio_ring = SpscRing(MIC_RING_CAPACITY) # Fresh ring per session.
+    save_segment_completed = False # A deliberate new session may record a fresh segment.
+    mic_data_event = asyncio.Event() # Sender's "ring has data" wake-up signal.
+    ws_ready = asyncio.Event() # Set by the manager while a connection is up.
+    # uvloop loops are drop-in replacements for the stock selector loop.
+    loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+    ws_background_loop = loop # Producers wake the sender through this loop.
     asyncio.set_event_loop(loop)
     threading.current_thread().websocket_loop = loop
     manager_task = None
+    sd_input_stream = None # sounddevice capture stream, if that path is taken.
     try:
         try:
-            audio_stream = p.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK, stream_callback=audio_callback)
-            audio_stream.start_stream() # Start the callback chain
-            print(f"{CLIENT_LOG_PREFIX} [STATUS] Microphone stream opened successfully.")
+            if args and args.audio_fd is not None:
+                # Test-harness mode: audio arrives over an inherited pipe fd, so
+                # no PyAudio capture (or loopback cable) is involved. The fd
+                # stands in for the microphone, hence the same readiness marker.
+                threading.Thread(target=read_audio_from_fd_loop, args=(args.audio_fd,), daemon=True).start()
+                print(f"{CLIENT_LOG_PREFIX} [STATUS] Microphone stream opened successfully.")
+            elif sounddevice is not None:
+                # Preferred capture path: RawInputStream keeps the realtime
+                # callback down to one ring copy on a raw C buffer.
+                sd_input_stream = sounddevice.RawInputStream(
+                    samplerate=RATE, channels=CHANNELS, dtype='int16',
+                    blocksize=CHUNK, callback=sd_input_callback)
+                sd_input_stream.start()
+                print(f"{CLIENT_LOG_PREFIX} [STATUS] Microphone stream opened successfully.")
+            else:
+                audio_stream = p.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK, stream_callback=audio_callback)
+                audio_stream.start_stream() # Start the callback chain
+                print(f"{CLIENT_LOG_PREFIX} [STATUS] Microphone stream opened successfully.")
         except IOError as e:
             print(f"{CLIENT_LOG_PREFIX} [ERROR] PyAudio Error (Input): {e}")
             error_str = str(e).lower()
@@ -364,27 +731,53 @@ def run_audio_and_websocket_loop():
             elif "device unavailable" in error_str or "device or resource busy" in error_str:
                 user_msg = "Error: Microphone is busy or unavailable."
             print(f"{CLIENT_LOG_PREFIX} [ERROR] Failed to open microphone: {user_msg}")
-            schedule_gui_update(root, status_label.config, text=user_msg)
+            set_status(user_msg)
             schedule_gui_update(root, start_button.config, state=tk.NORMAL)
             schedule_gui_update(root, stop_button.config, state=tk.DISABLED)
             app_running = False # Critical failure
             return # Exit thread
         except Exception as e:
             print(f"{CLIENT_LOG_PREFIX} [ERROR] Fatal: Unexpected error opening input audio stream: {e}")
-            schedule_gui_update(root, status_label.config, text=f"Status: Mic Error (unexpected) - {e}")
+            set_status(f"Status: Mic Error (unexpected) - {e}")
             schedule_gui_update(root, start_button.config, state=tk.NORMAL)
             schedule_gui_update(root, stop_button.config, state=tk.DISABLED)
             app_running = False
             return
 
+        # Open the speaker stream once per session, outside the receive task,
+        # so reconnects reuse it instead of paying PortAudio's open cost (and
+        # dropping the first frames) after every network blip. Failure is not
+        # fatal: mic streaming still works without playback.
+        try:
+            playback_jitter_buffer = collections.deque(maxlen=PLAYBACK_BUFFER_MAX_CHUNKS) # Received audio awaiting playback; bounded.
+            output_stream = p.open(format=FORMAT, channels=CHANNELS, rate=RATE, output=True,
+                                   frames_per_buffer=CHUNK,
+                                   stream_callback=make_playback_callback(playback_jitter_buffer))
+            output_stream.start_stream()
+            output_stream_active = True
+            print(f"{CLIENT_LOG_PREFIX} [STATUS] Speaker stream opened for received audio.")
+        except IOError as e:
+            print(f"{CLIENT_LOG_PREFIX} [ERROR] PyAudio Error (Output): {e}")
+            error_str = str(e).lower()
+            user_msg = "Error: Could not open speaker. Check audio settings."
+            if "invalid output device" in error_str or "no default output device" in error_str:
+                user_msg = "Error: No speaker found or invalid output device."
+            elif "device unavailable" in error_str or "device or resource busy" in error_str:
+                user_msg = "Error: Speaker is busy or unavailable."
+            print(f"{CLIENT_LOG_PREFIX} [ERROR] Failed to open speaker: {user_msg}")
+            set_status(user_msg)
+        except Exception as e:
+            print(f"{CLIENT_LOG_PREFIX} [ERROR] Unexpected error opening output audio stream: {e}")
+            set_status("Status: Error - Cannot play audio (unexpected).")
+
         # Update GUI now that mic is confirmed open
-        schedule_gui_update(root, status_label.config, text="Status: Mic open, connecting...")
+        set_status("Status: Mic open, connecting...")
 
         manager_task = loop.create_task(websocket_client_manager())
         loop.run_until_complete(manager_task) # Run the manager until it completes (or loop is stopped)
     except Exception as e:
         print(f"{CLIENT_LOG_PREFIX} [ERROR] Unhandled error in run_audio_and_websocket_loop: {e}")
-        schedule_gui_update(root, status_label.config, text=f"Status: Critical Error - {e}")
+        set_status(f"Status: Critical Error - {e}")
         app_running = False # Ensure main app knows something went wrong
     finally:
         print(f"{CLIENT_LOG_PREFIX} [INFO] run_audio_and_websocket_loop - finally block executing...")
@@ -396,6 +789,21 @@ def run_audio_and_websocket_loop():
                 print(f"{CLIENT_LOG_PREFIX} [INFO] Audio input stream (microphone) closed in finally.")
             except Exception as e: print(f"{CLIENT_LOG_PREFIX} [ERROR] Error closing input audio stream in finally: {e}")
             audio_stream = None # Reset global
+        if sd_input_stream:
+            try:
+                sd_input_stream.stop()
+                sd_input_stream.close()
+                print(f"{CLIENT_LOG_PREFIX} [INFO] Audio input stream (sounddevice) closed in finally.")
+            except Exception as e: print(f"{CLIENT_LOG_PREFIX} [ERROR] Error closing sounddevice input stream in finally: {e}")
+        if output_stream:
+            try:
+                if output_stream_active:
+                    output_stream_active = False
+                    output_stream.stop_stream()
+                output_stream.close()
+                print(f"{CLIENT_LOG_PREFIX} [INFO] Output audio stream (for received audio) closed.")
+            except Exception as e: print(f"{CLIENT_LOG_PREFIX} [ERROR] Error closing output stream for received audio: {e}")
+            output_stream = None # Reset global
 
         # Ensure manager task is awaited/cancelled if it didn't complete
         if manager_task and not manager_task.done():
@@ -423,7 +831,7 @@ def run_audio_and_websocket_loop():
         # Update GUI to reflect that operations have stopped.
         # This is important if the loop exits due to an error or normal completion.
         if not app_running or (manager_task and manager_task.done()): # Check if shutdown was intended or task completed
-            schedule_gui_update(root, status_label.config, text="Status: Stopped.")
+            set_status("Status: Stopped.")
             schedule_gui_update(root, start_button.config, state=tk.NORMAL)
             schedule_gui_update(root, stop_button.config, state=tk.DISABLED)
         print(f"{CLIENT_LOG_PREFIX} [INFO] run_audio_and_websocket_loop - background thread finished.")
@@ -439,14 +847,26 @@ def on_closing_main_window():
     """Handles the event when the main Tkinter window is closed by the user."""
     global app_running, p, root, CLIENT_LOG_PREFIX
     print(f"{CLIENT_LOG_PREFIX} [INFO] Main window closing sequence initiated (WM_DELETE_WINDOW).")
+    # Flip the liveness flag before joining: the worker's teardown makes GUI
+    # updates, and a Tcl call from another thread blocks until this (main)
+    # thread pumps events — which it won't while sitting in join(). With the
+    # flag down, schedule_gui_update skips the Tcl calls and the worker can
+    # actually finish, so the join below returns promptly.
+    root._exists = False
     if app_running:
         print(f"{CLIENT_LOG_PREFIX} [INFO] app_running is True from on_closing, setting to False to signal shutdown.")
         app_running = False # Signal background thread/tasks to stop
-
-    # Brief pause to allow background thread to start its shutdown sequence.
-    # A more robust solution would involve joining the thread (see suggestions for improvement).
-    print(f"{CLIENT_LOG_PREFIX} [INFO] Giving background tasks a moment to react to app_running=False (0.5s)...")
-    time.sleep(0.5)
+        _wake_sender() # So the sender sees the flag instead of napping on the ring.
+
+    # Join the worker thread so p.terminate() below can never race its
+    # stream-close calls (a crash risk inside PortAudio). Returns immediately
+    # when the thread already exited or never ran; the timeout only bounds a
+    # genuinely stuck teardown.
+    if worker_thread and worker_thread.is_alive():
+        print(f"{CLIENT_LOG_PREFIX} [INFO] Waiting for background thread to finish shutting down...")
+        worker_thread.join(timeout=2.0)
+        if worker_thread.is_alive():
+            print(f"{CLIENT_LOG_PREFIX} [WARN] Background thread did not finish shutdown in time; continuing close.")
 
     print(f"{CLIENT_LOG_PREFIX} [INFO] on_closing_main_window: Terminating global PyAudio instance.")
     if p:
@@ -457,7 +877,7 @@ def on_closing_main_window():
             print(f"{CLIENT_LOG_PREFIX} [ERROR] Error terminating global PyAudio instance: {e}")
 
     print(f"{CLIENT_LOG_PREFIX} [INFO] on_closing_main_window: Destroying Tkinter root window.")
-    if root: # Check if root still exists
+    if root: # Check if root still exists (liveness flag already lowered above)
         root.destroy()
         # root = None # Not strictly necessary, Python's GC will handle.
         print(f"{CLIENT_LOG_PREFIX} [INFO] Tkinter root window destroyed.")
@@ -465,8 +885,8 @@ def on_closing_main_window():
 
 # --- Main Execution Block ---
 if __name__ == "__main__":
-    global args, CLIENT_LOG_PREFIX # args needs to be global for other functions to access it
-
+    # Note: no 'global' statement needed here; this block runs at module level,
+    # so assigning to 'args' below rebinds the module-level global directly.
     parser = argparse.ArgumentParser(description="PC Audio Client for streaming audio to an Android WebSocket server.")
     parser.add_argument(
         "--auto-start",
@@ -487,8 +907,25 @@ if __name__ == "__main__":
         metavar="SECONDS",
         help="Duration of received audio to save in seconds (default: 5)."
     )
+    parser.add_argument(
+        "--audio-fd",
+        type=int,
+        default=None,
+        metavar="FD",
+        help="Read input audio as raw PCM from this inherited file descriptor instead of the microphone (used by the test harness)."
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Enable per-chunk DEBUG logging (adds ~86 log calls/s on the audio hot path; diagnosis only)."
+    )
     args = parser.parse_args() # Parse arguments and store them in the global 'args'
 
+    # INFO by default so the per-chunk log.debug() calls are filtered out
+    # before formatting; --verbose raises to DEBUG when diagnosing audio flow.
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(message)s")
+
     # Initial IP configuration check (runs in main thread before mainloop)
     if ANDROID_PHONE_IP == "YOUR_ANDROID_PHONE_IP_ADDRESS":
         # This direct GUI update is safe as it's before mainloop()